@@ -5,15 +5,27 @@ https://www.diarioficialdosmunicipios.org/edicao_atual.html
 
 import os
 import re
+import sys
 import json
 import logging
+import threading
+import multiprocessing
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import unicodedata
 import asyncio
+import functools
 from io import BytesIO
-from datetime import datetime, time
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, Bot
-from telegram.error import NetworkError
+from array import array
+from urllib.parse import urlparse
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, time, timedelta
+from time import monotonic
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, Bot, InputFile
+from telegram.error import NetworkError, RetryAfter
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -23,16 +35,220 @@ from telegram.ext import (
     filters,
 )
 import fitz  # PyMuPDF para destacar palavras no PDF
+import ahocorasick  # Busca de várias palavras-chave em uma única passada
+from aiolimiter import AsyncLimiter  # Limite de envios por segundo ao Telegram
+try:
+    import uvloop  # Loop de eventos mais rápido (não disponível no Windows)
+except ImportError:
+    uvloop = None
 from dotenv import load_dotenv
 
 
+# Tabela que remove os caracteres de combinação (acentos) via str.translate
+_COMBINING_TABLE = {c: None for c in range(sys.maxunicode + 1) if unicodedata.category(chr(c)) == 'Mn'}
+
+
 def normalize_text(text: str) -> str:
     """Remove acentos e normaliza texto para busca."""
-    # Normaliza para forma NFD (decompõe caracteres acentuados)
-    normalized = unicodedata.normalize('NFD', text)
-    # Remove caracteres de combinação (acentos)
-    without_accents = ''.join(c for c in normalized if unicodedata.category(c) != 'Mn')
-    return without_accents.lower()
+    # Texto só com ASCII não tem acentos nem ligaduras a tratar
+    if text.isascii():
+        return text.lower()
+    # Decompõe caracteres acentuados (NFKD também separa ligaduras como "ﬁ")
+    normalized = unicodedata.normalize('NFKD', text)
+    # Sempre remove os acentos: texto já decomposto (NFD) volta do NFKD como está
+    return normalized.translate(_COMBINING_TABLE).lower()
+
+
+# Cache dos autômatos de busca, indexado pelo conjunto de palavras-chave
+_automaton_cache = {}
+_automaton_lock = threading.Lock()
+AUTOMATON_CACHE_SIZE = 32
+
+
+def _build_automaton(patterns: dict) -> ahocorasick.Automaton:
+    """Cria um autômato Aho-Corasick a partir de {padrão: [palavras-chave]}."""
+    automaton = ahocorasick.Automaton()
+    for pattern, keywords in patterns.items():
+        if pattern:
+            automaton.add_word(pattern, (pattern, tuple(keywords)))
+    automaton.make_automaton()
+    return automaton
+
+
+def get_keyword_automaton(keywords: list) -> ahocorasick.Automaton:
+    """Retorna o autômato (texto sem acentos) para as palavras-chave.
+
+    Os autômatos ficam em cache, então pesquisas repetidas com as mesmas
+    palavras-chave não precisam reconstruí-los.
+    """
+    cache_key = tuple(sorted(keywords))
+    with _automaton_lock:
+        automaton = _automaton_cache.get(cache_key)
+    if automaton is not None:
+        return automaton
+
+    patterns = {}
+    for keyword in keywords:
+        keyword_clean = ' '.join(keyword.split())
+        patterns.setdefault(normalize_text(keyword_clean), []).append(keyword)
+
+    automaton = _build_automaton(patterns)
+    with _automaton_lock:
+        if len(_automaton_cache) >= AUTOMATON_CACHE_SIZE:
+            _automaton_cache.clear()
+        _automaton_cache[cache_key] = automaton
+    return automaton
+
+
+def iter_keyword_matches(automaton: ahocorasick.Automaton, text: str):
+    """Percorre o texto uma única vez e gera (início, fim, palavras-chave) de cada ocorrência.
+
+    Ocorrências sobrepostas do mesmo padrão são ignoradas, mantendo a mesma
+    contagem de str.count().
+    """
+    if len(automaton) == 0:
+        return
+    last_end = {}
+    for end_idx, (pattern, keywords) in automaton.iter(text):
+        start = end_idx - len(pattern) + 1
+        if start < last_end.get(pattern, 0):
+            continue
+        last_end[pattern] = end_idx + 1
+        yield start, end_idx + 1, keywords
+
+
+def _new_results(keywords: list) -> dict:
+    return {
+        keyword: {"count": 0, "pages": set(), "contexts": [], "spans": [], "_ctx_set": set()}
+        for keyword in keywords
+    }
+
+
+def _finish_results(results: dict) -> dict:
+    """Converte as páginas em lista ordenada e remove os conjuntos auxiliares (formato serializável)."""
+    for entry in results.values():
+        entry["pages"] = sorted(entry["pages"])
+        entry.pop("_ctx_set", None)
+    return results
+
+
+def _add_match(entry: dict, page_number: int, page_text: tuple, start: int, end: int) -> None:
+    """Registra uma ocorrência (contagem, página, posição e contexto) no resultado da palavra-chave."""
+    entry["count"] += 1
+    entry["spans"].append((page_number, (start, end)))
+    entry["pages"].add(page_number)
+
+    if len(entry["contexts"]) < 5:  # Máximo 5 contextos
+        _, original_text, index_map = page_text
+        # Converte as posições do texto normalizado para o texto original
+        if index_map is not None:
+            start, end = index_map[start], index_map[end - 1] + 1
+        context = original_text[max(0, start - 50):end + 50].strip()
+        # Conjunto auxiliar evita percorrer a lista a cada ocorrência
+        if context and context not in entry["_ctx_set"]:
+            entry["_ctx_set"].add(context)
+            entry["contexts"].append(f"...{context}...")
+
+
+def _extract_page_texts(doc: fitz.Document, start_page: int, end_page: int) -> list:
+    """Extrai o texto das páginas [start_page, end_page) de um documento aberto.
+
+    Retorna, por página, (texto normalizado, texto original, mapa de posições), ou None
+    se a página não tem texto. mapa[i] é a posição no texto original do caractere que
+    gerou a posição i do texto normalizado (None quando as posições coincidem).
+    """
+    page_texts = []
+    normalized_chars = {}  # Cada caractere distinto é normalizado uma única vez
+    for page_num in range(start_page, end_page):
+        text = doc[page_num].get_text()
+        if not text:
+            page_texts.append(None)
+            continue
+
+        # Normaliza texto removendo quebras de linha e espaços extras para melhor busca
+        text_single_line = ' '.join(text.split())  # Remove quebras de linha e espaços múltiplos
+        text_normalized = normalize_text(text_single_line)
+
+        index_map = None
+        if len(text_normalized) != len(text_single_line):
+            # NFKD mudou o tamanho (ex.: "…" vira "...", "ﬁ" vira "fi"): normaliza caractere
+            # a caractere, guardando de qual posição do original veio cada caractere
+            # (array de inteiros de 4 bytes: o mapa fica no cache e volta dos processos)
+            text_parts = []
+            index_map = array('I')
+            for original_pos, char in enumerate(text_single_line):
+                normalized = normalized_chars.get(char)
+                if normalized is None:
+                    normalized = normalized_chars[char] = normalize_text(char)
+                text_parts.append(normalized)
+                index_map.extend([original_pos] * len(normalized))
+            text_normalized = "".join(text_parts)
+
+        page_texts.append((text_normalized, text_single_line, index_map))
+
+    return page_texts
+
+
+def _extract_page_range(pdf_path: str, start_page: int, end_page: int) -> list:
+    """Executado em outro processo: abre o PDF do cache e extrai o texto de um intervalo de páginas."""
+    with fitz.open(pdf_path) as doc:
+        return _extract_page_texts(doc, start_page, end_page)
+
+
+def _scan_page_texts(page_texts: list, keywords: list) -> dict:
+    """Pesquisa as palavras-chave no texto já extraído das páginas."""
+    results = _new_results(keywords)
+    automaton = get_keyword_automaton(keywords)
+
+    for page_num, page_text in enumerate(page_texts):
+        if page_text is None:
+            continue
+        text_normalized = page_text[0]
+
+        # Uma única passada encontra todas as palavras-chave (sem acentos)
+        for start, end, matched in iter_keyword_matches(automaton, text_normalized):
+            for keyword in matched:
+                _add_match(results[keyword], page_num + 1, page_text, start, end)
+
+    return _finish_results(results)
+
+
+def _page_text_boxes(page: fitz.Page) -> tuple:
+    """Reconstrói o texto da página como na pesquisa, com a caixa de cada caractere.
+
+    Retorna (texto normalizado, caixas), onde caixas[i] é (linha, bbox) do caractere
+    de origem da posição i do texto, ou None para os espaços entre palavras.
+    """
+    text_parts = []
+    boxes = []
+    pending_space = False
+    line_number = 0
+    normalized_chars = {}  # Cada caractere distinto é normalizado uma única vez por página
+    
+    raw = page.get_text("rawdict", flags=fitz.TEXTFLAGS_TEXT)
+    for block in raw["blocks"]:
+        for line in block.get("lines", []):
+            for span in line["spans"]:
+                for char in span["chars"]:
+                    if char["c"].isspace():
+                        pending_space = True
+                        continue
+                    if pending_space and text_parts:
+                        text_parts.append(" ")
+                        boxes.append(None)
+                    pending_space = False
+                    
+                    normalized = normalized_chars.get(char["c"])
+                    if normalized is None:
+                        normalized = normalized_chars[char["c"]] = normalize_text(char["c"])
+                    text_parts.append(normalized)
+                    boxes.extend([(line_number, char["bbox"])] * len(normalized))
+            # Quebra de linha vira espaço, como em ' '.join(text.split())
+            pending_space = True
+            line_number += 1
+    
+    return "".join(text_parts), boxes
+
 
 # Carrega variáveis de ambiente
 load_dotenv()
@@ -50,10 +266,21 @@ BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 # ID do chat para notificações automáticas
 NOTIFY_CHAT_ID = os.getenv("NOTIFY_CHAT_ID")
 
+# Webhook (opcional): com WEBHOOK_URL definido, o Telegram envia as mensagens ao bot em vez de polling
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+
 # URL base do Diário Oficial dos Municípios
 BASE_URL = "https://www.diarioficialdosmunicipios.org"
 EDICAO_ATUAL_URL = f"{BASE_URL}/edicao_atual.html"
 
+# Número e data da edição na página "edição atual"
+_EDITION_RE = re.compile(r'Edição\s*(\d+),\s*(\d{2}/\d{2}/\d{4})')
+
+# Caracteres de formatação Markdown removidos dos contextos exibidos
+_MARKDOWN_RE = re.compile(r'[*_`]')
+
 # Palavras-chave padrão (vazio - usuário escolhe as suas)
 DEFAULT_KEYWORDS = []
 
@@ -66,6 +293,43 @@ CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")
 # Arquivo para salvar usuários inscritos
 SUBSCRIBERS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "subscribers.json")
 
+# Intervalo (segundos) para salvar alterações de inscritos no arquivo
+SUBSCRIBERS_FLUSH_INTERVAL = 5
+
+# Arquivo com ETag/Last-Modified das últimas respostas (para requisições condicionais)
+HTTP_META_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "http_cache.json")
+
+# Cópia da página da edição atual (reutilizada quando o servidor responde 304)
+EDICAO_ATUAL_CACHE = os.path.join(CACHE_DIR, "edicao_atual.html")
+
+# Segundos em que as informações da edição atual são reaproveitadas sem consultar o site
+EDITION_INFO_TTL = 60
+
+# Quantidade de edições mantidas no cache de textos extraídos
+SEARCH_CACHE_EDITIONS = 3
+
+# Máximo de pesquisas mantidas em cache (as menos usadas saem primeiro)
+SEARCH_CACHE_SIZE = 64
+
+# Mínimo de páginas por processo na pesquisa paralela do PDF
+MIN_PAGES_PER_WORKER = 16
+
+# Pool dedicado ao trabalho pesado com PDFs (pesquisa e destaque), separado das requisições HTTP.
+# Uma única thread: o PyMuPDF não suporta uso simultâneo em várias threads
+PDF_POOL = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pdf")
+
+# Limite de upload de arquivos do Telegram e parâmetros para reduzir PDFs acima dele
+TELEGRAM_UPLOAD_LIMIT = 50 * 1024 * 1024
+MAX_IMAGE_DPI = 150
+SHRINK_JPEG_QUALITY = 60
+
+# Envios simultâneos ao Telegram nas notificações para todos os inscritos
+BROADCAST_CONCURRENCY = 25
+
+# Limites do Telegram: ~30 mensagens/s no total e 1 mensagem/s por chat
+GLOBAL_SEND_LIMITER = AsyncLimiter(30, 1)
+CHAT_SEND_LIMITERS = defaultdict(lambda: AsyncLimiter(1, 1))
+
 
 class DiarioOficialBot:
     def __init__(self):
@@ -73,6 +337,31 @@ class DiarioOficialBot:
         self.subscribers = set()  # Usuários inscritos para notificações
         self.cached_edition = None  # Cache da edição atual
         self.cached_pdf_path = None  # Caminho do PDF em cache
+        self.last_notified_edition = None  # Última edição já pesquisada e enviada aos inscritos
+        self._dirty = False  # Inscritos/palavras-chave alterados e ainda não salvos
+        self._http_meta = {}  # ETag/Last-Modified por URL
+        self._http_meta_lock = threading.Lock()  # Página da edição e download gravam de threads diferentes
+        self._edition_cache = None  # (momento da consulta, informações da edição)
+        self._edition_lock = threading.Lock()
+        self._download_lock = threading.Lock()
+        self._pdf_checked = {}  # URL -> momento da última verificação do PDF em cache
+        self._search_cache = OrderedDict()  # (edição, palavras normalizadas) -> resultado da pesquisa (LRU)
+        self._page_text_cache = {}  # edição -> texto extraído de cada página
+        self._search_lock = threading.Lock()
+        self._process_pool = None  # Processos da extração paralela, criados na primeira vez
+        self._pool_lock = threading.Lock()
+        
+        # Sessão HTTP com conexões reaproveitadas (keep-alive) para o site do Diário
+        self.session = requests.Session()
+        # Novas tentativas (com espera crescente) só para falhas ao conectar; servidor que
+        # aceita a conexão e não responde não é repetido (read=0)
+        adapter = HTTPAdapter(
+            pool_connections=8,
+            pool_maxsize=8,
+            max_retries=Retry(total=3, connect=3, read=0, backoff_factor=0.3)
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
         
         # Cria diretório de cache se não existir
         if not os.path.exists(CACHE_DIR):
@@ -80,6 +369,7 @@ class DiarioOficialBot:
         
         # Carrega usuários inscritos
         self.load_subscribers()
+        self.load_http_meta()
     
     def load_subscribers(self) -> None:
         """Carrega usuários inscritos do arquivo JSON."""
@@ -94,24 +384,39 @@ class DiarioOficialBot:
             logger.error(f"Erro ao carregar subscribers: {e}")
             self.subscribers = set()
     
-    def save_subscribers(self) -> None:
-        """Salva usuários inscritos no arquivo JSON."""
+    def save_subscribers(self) -> bool:
+        """Salva usuários inscritos no arquivo JSON. Retorna se conseguiu salvar."""
         try:
             data = {
                 "subscribers": list(self.subscribers),
                 "keywords": {str(k): v for k, v in self.user_keywords.items()}
             }
-            with open(SUBSCRIBERS_FILE, "w") as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
+            # Grava em arquivo temporário e substitui, para não corromper o arquivo se o bot cair
+            tmp_file = f"{SUBSCRIBERS_FILE}.tmp"
+            with open(tmp_file, "w") as f:
+                json.dump(data, f, separators=(",", ":"), ensure_ascii=False)
+            os.replace(tmp_file, SUBSCRIBERS_FILE)
             logger.info(f"Salvos {len(self.subscribers)} usuário(s) inscrito(s)")
+            return True
         except Exception as e:
             logger.error(f"Erro ao salvar subscribers: {e}")
+            return False
+    
+    def mark_dirty(self) -> None:
+        """Marca inscritos/palavras-chave como alterados; são salvos no próximo flush."""
+        self._dirty = True
+    
+    def flush_subscribers(self) -> None:
+        """Salva inscritos e palavras-chave se houve alteração desde o último flush."""
+        # Se a gravação falhar, as alterações continuam pendentes para o próximo flush
+        if self._dirty and self.save_subscribers():
+            self._dirty = False
     
     def add_subscriber(self, chat_id: int) -> bool:
         """Adiciona um usuário à lista de inscritos."""
         if chat_id not in self.subscribers:
             self.subscribers.add(chat_id)
-            self.save_subscribers()
+            self.mark_dirty()
             logger.info(f"Novo inscrito: {chat_id}")
             return True
         return False
@@ -120,202 +425,429 @@ class DiarioOficialBot:
         """Remove um usuário da lista de inscritos."""
         if chat_id in self.subscribers:
             self.subscribers.discard(chat_id)
-            self.save_subscribers()
+            CHAT_SEND_LIMITERS.pop(chat_id, None)
+            self.mark_dirty()
             logger.info(f"Inscrito removido: {chat_id}")
             return True
         return False
+    
+    def remove_subscribers_bulk(self, chat_ids) -> int:
+        """Remove vários inscritos de uma vez. Retorna quantos foram removidos."""
+        removed = self.subscribers.intersection(chat_ids)
+        if removed:
+            self.subscribers.difference_update(removed)
+            # Limitadores só existem para os chats que recebem as notificações
+            for chat_id in removed:
+                CHAT_SEND_LIMITERS.pop(chat_id, None)
+            self.mark_dirty()
+            logger.info(f"Inscritos removidos: {sorted(removed)}")
+        return len(removed)
+
+    def load_http_meta(self) -> None:
+        """Carrega ETag/Last-Modified salvos do arquivo JSON."""
+        try:
+            if os.path.exists(HTTP_META_FILE):
+                with open(HTTP_META_FILE, "r") as f:
+                    self._http_meta = json.load(f)
+        except Exception as e:
+            logger.error(f"Erro ao carregar metadados HTTP: {e}")
+            self._http_meta = {}
+
+    def save_http_meta(self, url: str, response: requests.Response) -> None:
+        """Guarda ETag/Last-Modified de uma resposta para a próxima requisição condicional."""
+        meta = {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+        }
+        with self._http_meta_lock:
+            if not any(meta.values()):
+                self._http_meta.pop(url, None)
+            else:
+                self._http_meta[url] = meta
+            try:
+                # Grava em arquivo temporário e substitui, para não corromper o arquivo se o bot cair
+                tmp_file = f"{HTTP_META_FILE}.tmp"
+                with open(tmp_file, "w") as f:
+                    json.dump(self._http_meta, f, indent=2)
+                os.replace(tmp_file, HTTP_META_FILE)
+            except Exception as e:
+                logger.error(f"Erro ao salvar metadados HTTP: {e}")
+
+    def conditional_headers(self, url: str) -> dict:
+        """Cabeçalhos If-None-Match/If-Modified-Since para a URL (vazio se não houver)."""
+        with self._http_meta_lock:
+            meta = self._http_meta.get(url, {})
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        return headers
+
+    def fetch_edition_page(self) -> str:
+        """Baixa a página da edição atual, reutilizando a cópia local se não mudou (304)."""
+        headers = self.conditional_headers(EDICAO_ATUAL_URL) if os.path.exists(EDICAO_ATUAL_CACHE) else {}
+        response = self.session.get(EDICAO_ATUAL_URL, headers=headers, timeout=(10, 30))
+        
+        if response.status_code == 304:
+            logger.info("Página da edição atual não mudou, usando cópia em cache")
+            with open(EDICAO_ATUAL_CACHE, "r", encoding="utf-8") as f:
+                return f.read()
+        
+        response.raise_for_status()
+        html_content = response.text
+        try:
+            with open(EDICAO_ATUAL_CACHE, "w", encoding="utf-8") as f:
+                f.write(html_content)
+            self.save_http_meta(EDICAO_ATUAL_URL, response)
+        except OSError as e:
+            logger.error(f"Erro ao salvar página da edição em cache: {e}")
+        return html_content
+
+    def edition_exists(self, edition: int) -> bool:
+        """Verifica se o PDF de uma edição existe no servidor."""
+        url = f"{BASE_URL}/intranet/_lib/file/doc/pdfs/novo/{edition}/DM_{edition}.pdf"
+        try:
+            return self.session.head(url, timeout=10).status_code == 200
+        except requests.RequestException:
+            return False
 
     def find_latest_edition(self, start_from: int = EDITION_BASE) -> int:
         """Encontra a edição mais recente testando URLs."""
-        edition = start_from
+        # Verifica até 30 edições à frente: algumas em paralelo para achar o intervalo...
+        probes = [0, 8, 16, 24]
+        with ThreadPoolExecutor(max_workers=len(probes)) as executor:
+            found = list(executor.map(lambda offset: self.edition_exists(start_from + offset), probes))
         
-        # Tenta encontrar edições mais recentes (verifica até 30 edições à frente)
-        for i in range(30):
-            test_edition = edition + i
-            url = f"{BASE_URL}/intranet/_lib/file/doc/pdfs/novo/{test_edition}/DM_{test_edition}.pdf"
-            try:
-                response = requests.head(url, timeout=10)
-                if response.status_code == 200:
-                    edition = test_edition
-                else:
-                    break
-            except:
+        last_found, first_missing = 0, 30
+        for offset, exists in zip(probes, found):
+            if not exists:
+                first_missing = offset
                 break
+            last_found = offset
+        
+        # ...e depois busca binária dentro dele
+        if first_missing > 0:
+            while first_missing - last_found > 1:
+                middle = (last_found + first_missing) // 2
+                if self.edition_exists(start_from + middle):
+                    last_found = middle
+                else:
+                    first_missing = middle
         
+        edition = start_from + last_found
         logger.info(f"Edição mais recente encontrada: {edition}")
         return edition
 
     def get_current_edition_info(self) -> dict:
-        """Obtém informações da edição atual do Diário Oficial."""
-        try:
-            # Primeiro tenta pegar da página HTML
-            response = requests.get(EDICAO_ATUAL_URL, timeout=30)
-            response.raise_for_status()
-            html_content = response.text
-
-            # Extrai número da edição e data
-            edition_match = re.search(r'Edição\s*(\d+),\s*(\d{2}/\d{2}/\d{4})', html_content)
+        """Obtém informações da edição atual do Diário Oficial (consulta o site no máximo a cada minuto)."""
+        # O lock também faz chamadas simultâneas esperarem pela mesma consulta
+        with self._edition_lock:
+            now = monotonic()
+            if self._edition_cache and now - self._edition_cache[0] < EDITION_INFO_TTL:
+                return self._edition_cache[1]
             
-            if edition_match:
-                edition_number = edition_match.group(1)
-                edition_date = edition_match.group(2)
+            try:
+                info = self.fetch_edition_info()
+            except requests.RequestException as e:
+                logger.error(f"Erro ao acessar página: {e}")
+                
+                # Edição base não vai para o cache: tenta o site de novo na próxima chamada
+                edition_number = EDITION_BASE
                 pdf_url = f"{BASE_URL}/intranet/_lib/file/doc/pdfs/novo/{edition_number}/DM_{edition_number}.pdf"
+                edition_date = datetime.now().strftime("%d/%m/%Y")
                 
                 return {
-                    "edition_number": edition_number,
+                    "edition_number": str(edition_number),
                     "edition_date": edition_date,
                     "pdf_url": pdf_url,
                     "success": True
                 }
             
-            # Se não encontrou no HTML (página com JavaScript), busca a edição mais recente
-            logger.info("HTML não contém edição, buscando edição mais recente...")
-            edition_number = self.find_latest_edition()
-            pdf_url = f"{BASE_URL}/intranet/_lib/file/doc/pdfs/novo/{edition_number}/DM_{edition_number}.pdf"
-            
-           
-            from datetime import datetime
-            edition_date = datetime.now().strftime("%d/%m/%Y")
-            
-            return {
-                "edition_number": str(edition_number),
-                "edition_date": edition_date,
-                "pdf_url": pdf_url,
-                "success": True
-            }
-            
-        except requests.RequestException as e:
-            logger.error(f"Erro ao acessar página: {e}")
-            
-           
-            edition_number = EDITION_BASE
+            self._edition_cache = (now, info)
+            return info
+
+    def reset_edition_info(self) -> None:
+        """Descarta as informações da edição atual guardadas; a próxima chamada consulta o site."""
+        with self._edition_lock:
+            self._edition_cache = None
+
+    def fetch_edition_info(self) -> dict:
+        """Consulta o site e obtém informações da edição atual do Diário Oficial."""
+        # Primeiro tenta pegar da página HTML
+        html_content = self.fetch_edition_page()
+
+        # Extrai número da edição e data
+        edition_match = _EDITION_RE.search(html_content)
+        
+        if edition_match:
+            edition_number = edition_match.group(1)
+            edition_date = edition_match.group(2)
             pdf_url = f"{BASE_URL}/intranet/_lib/file/doc/pdfs/novo/{edition_number}/DM_{edition_number}.pdf"
-            from datetime import datetime
-            edition_date = datetime.now().strftime("%d/%m/%Y")
             
             return {
-                "edition_number": str(edition_number),
+                "edition_number": edition_number,
                 "edition_date": edition_date,
                 "pdf_url": pdf_url,
                 "success": True
             }
-
-    def get_cached_pdf(self, edition_number: str) -> BytesIO | None:
-        """Retorna o PDF do cache se existir."""
+        
+        # Se não encontrou no HTML (página com JavaScript), busca a edição mais recente
+        logger.info("HTML não contém edição, buscando edição mais recente...")
+        edition_number = self.find_latest_edition()
+        pdf_url = f"{BASE_URL}/intranet/_lib/file/doc/pdfs/novo/{edition_number}/DM_{edition_number}.pdf"
+        edition_date = datetime.now().strftime("%d/%m/%Y")
+        
+        return {
+            "edition_number": str(edition_number),
+            "edition_date": edition_date,
+            "pdf_url": pdf_url,
+            "success": True
+        }
+
+    def get_cached_pdf(self, edition_number: str) -> str | None:
+        """Retorna o caminho do PDF em cache se existir."""
         cache_file = os.path.join(CACHE_DIR, f"DM_{edition_number}.pdf")
         
         if os.path.exists(cache_file):
             logger.info(f"Usando PDF em cache: {cache_file}")
-            with open(cache_file, "rb") as f:
-                return BytesIO(f.read())
+            return cache_file
         return None
 
-    def save_pdf_to_cache(self, edition_number: str, pdf_bytes: BytesIO) -> None:
-        """Salva o PDF no cache."""
-        cache_file = os.path.join(CACHE_DIR, f"DM_{edition_number}.pdf")
-        pdf_bytes.seek(0)
+    def download_pdf(self, url: str, edition_number: str = None) -> str | None:
+        """Baixa o PDF direto para o cache e retorna o caminho do arquivo. Usa cache se disponível."""
+        if edition_number:
+            cache_file = os.path.join(CACHE_DIR, f"DM_{edition_number}.pdf")
+        else:
+            cache_file = os.path.join(CACHE_DIR, os.path.basename(url))
         
-        with open(cache_file, "wb") as f:
-            f.write(pdf_bytes.read())
+        # PDF verificado há pouco: usa o cache sem esperar por outros downloads
+        if self._recently_checked(url) and os.path.exists(cache_file):
+            logger.info(f"Usando PDF em cache: {cache_file}")
+            return cache_file
         
-        pdf_bytes.seek(0)
-        logger.info(f"PDF salvo em cache: {cache_file}")
-
-    def download_pdf(self, url: str, edition_number: str = None) -> BytesIO | None:
-        """Baixa o PDF e retorna como BytesIO. Usa cache se disponível."""
-        # Tenta usar cache primeiro
-        if edition_number:
-            cached = self.get_cached_pdf(edition_number)
-            if cached:
+        # Um download por vez: pedidos simultâneos esperam e reaproveitam o arquivo já baixado
+        with self._download_lock:
+            try:
+                return self._download_pdf(url, cache_file, edition_number)
+            finally:
+                # Verificado (ou falhou) agora: não consulta o servidor de novo antes do TTL
+                if os.path.exists(cache_file):
+                    self._pdf_checked[url] = monotonic()
+
+    def _recently_checked(self, url: str) -> bool:
+        checked = self._pdf_checked.get(url)
+        return checked is not None and monotonic() - checked < EDITION_INFO_TTL
+
+    def _download_pdf(self, url: str, cache_file: str, edition_number: str = None) -> str | None:
+        # Com cache, só baixa de novo se o servidor disser que o PDF mudou
+        cached = cache_file if os.path.exists(cache_file) else None
+        headers = {}
+        if cached:
+            # Quem esperava no lock reaproveita a verificação que acabou de ser feita
+            if self._recently_checked(url):
+                logger.info(f"Usando PDF em cache: {cached}")
+                return cached
+            headers = self.conditional_headers(url)
+            if not headers:
+                logger.info(f"Usando PDF em cache: {cached}")
                 return cached
         
+        # Grava em arquivo temporário para não deixar PDF incompleto no cache
+        partial_file = f"{cache_file}.part"
         try:
-            logger.info(f"Baixando PDF: {url}")
-            # Timeout alto pois o PDF pode ter centenas de páginas (~500MB)
-            response = requests.get(url, timeout=600)  # 10 minutos
-            response.raise_for_status()
-            pdf_bytes = BytesIO(response.content)
+            logger.info(f"Verificando PDF em cache: {url}" if cached else f"Baixando PDF: {url}")
+            # Só o primeiro download tem timeout alto (PDF de centenas de páginas, ~500MB);
+            # a verificação do cache desiste logo se o servidor não responder
+            timeout = (10, 30) if cached else (10, 600)  # (conexão, leitura) em segundos
+            with self.session.get(url, headers=headers, stream=True, timeout=timeout) as response:
+                if response.status_code == 304:
+                    logger.info(f"PDF não mudou, usando cache: {cached}")
+                    return cached
+                
+                response.raise_for_status()
+                # Copia em blocos para o disco, sem manter o PDF inteiro na memória
+                # (iter_content converte falhas da conexão em exceções do requests)
+                with open(partial_file, "wb") as f:
+                    for chunk in response.iter_content(1 << 20):
+                        f.write(chunk)
             
-            # Salva no cache
+            os.replace(partial_file, cache_file)
+            self.save_http_meta(url, response)
             if edition_number:
-                self.save_pdf_to_cache(edition_number, pdf_bytes)
-            
-            return pdf_bytes
-        except requests.RequestException as e:
+                # PDF novo: pesquisas anteriores desta edição não valem mais
+                self.drop_search_cache(edition_number)
+            logger.info(f"PDF salvo em cache: {cache_file}")
+            return cache_file
+        except (requests.RequestException, OSError) as e:
             logger.error(f"Erro ao baixar PDF: {e}")
-            return None
+            # Se não foi possível verificar, o PDF em cache ainda serve
+            return cached
+        finally:
+            # Download interrompido (por qualquer motivo) não deixa arquivo parcial
+            if os.path.exists(partial_file):
+                try:
+                    os.remove(partial_file)
+                except OSError as e:
+                    logger.warning(f"Não foi possível remover {partial_file}: {e}")
 
     def clear_cache(self) -> int:
         """Limpa o cache de PDFs. Retorna quantidade de arquivos removidos."""
+        # Força nova consulta da edição atual e novas pesquisas
+        self.reset_edition_info()
+        self.drop_search_cache()
+        
         count = 0
         if os.path.exists(CACHE_DIR):
-            for file in os.listdir(CACHE_DIR):
-                if file.endswith(".pdf"):
-                    os.remove(os.path.join(CACHE_DIR, file))
-                    count += 1
+            with os.scandir(CACHE_DIR) as entries:
+                for entry in entries:
+                    if entry.name.endswith(".pdf") and entry.is_file():
+                        # No Windows um PDF ainda aberto não pode ser removido; segue com os demais
+                        try:
+                            os.unlink(entry.path)
+                        except OSError as e:
+                            logger.warning(f"Não foi possível remover {entry.name} do cache: {e}")
+                            continue
+                        count += 1
         return count
 
-    def search_keywords_in_pdf(self, pdf_bytes: BytesIO, keywords: list) -> dict:
-        """Pesquisa palavras-chave no PDF e retorna ocorrências."""
-        results = {keyword: {"count": 0, "pages": [], "contexts": []} for keyword in keywords}
+    def drop_search_cache(self, edition_number: str = None) -> None:
+        """Descarta pesquisas e textos extraídos em cache de uma edição (ou de todas)."""
+        with self._search_lock:
+            if edition_number is None:
+                self._search_cache.clear()
+                self._page_text_cache.clear()
+            else:
+                for key in [key for key in self._search_cache if key[0] == edition_number]:
+                    del self._search_cache[key]
+                self._page_text_cache.pop(edition_number, None)
+
+    def search_edition(self, edition_number: str, doc: fitz.Document, keywords: list) -> dict:
+        """Pesquisa palavras-chave em uma edição, reaproveitando pesquisas iguais já feitas."""
+        normalized = {keyword: normalize_text(' '.join(keyword.split())) for keyword in keywords}
+        cache_key = (edition_number, frozenset(normalized.values()))
         
-        try:
-            pdf_bytes.seek(0)
-            doc = fitz.open(stream=pdf_bytes.read(), filetype="pdf")
-            total_pages = len(doc)
-            
-            for page_num in range(total_pages):
-                page = doc[page_num]
-                text = page.get_text()
-                if not text:
-                    continue
-                
-                # Normaliza texto removendo quebras de linha e espaços extras para melhor busca
-                text_single_line = ' '.join(text.split())  # Remove quebras de linha e espaços múltiplos
-                text_normalized = normalize_text(text_single_line)
-                text_lower = text_single_line.lower()
-                
-                for keyword in keywords:
-                    keyword_clean = ' '.join(keyword.split())  # Normaliza keyword também
-                    keyword_normalized = normalize_text(keyword_clean)
-                    keyword_lower = keyword_clean.lower()
-                    
-                    # Conta ocorrências (busca com e sem acentos)
-                    count = text_normalized.count(keyword_normalized)
-                    if count == 0:
-                        count = text_lower.count(keyword_lower)
-                    
-                    if count > 0:
-                        results[keyword]["count"] += count
-                        if (page_num + 1) not in results[keyword]["pages"]:
-                            results[keyword]["pages"].append(page_num + 1)
-                        
-                        # Extrai contexto usando texto normalizado para encontrar trechos relevantes
-                        # Procura no texto normalizado e depois encontra a posição original
-                        keyword_pos = text_lower.find(keyword_lower)
-                        while keyword_pos != -1:
-                            start_pos = max(0, keyword_pos - 50)
-                            end_pos = min(len(text_single_line), keyword_pos + len(keyword_clean) + 50)
-                            context = text_single_line[start_pos:end_pos].strip()
-                            if context and context not in results[keyword]["contexts"]:
-                                results[keyword]["contexts"].append(f"...{context}...")
-                                if len(results[keyword]["contexts"]) >= 5:  # Máximo 5 contextos
-                                    break
-                            keyword_pos = text_lower.find(keyword_lower, keyword_pos + 1)
+        with self._search_lock:
+            cached = self._search_cache.get(cache_key)
+            if cached is not None:
+                self._search_cache.move_to_end(cache_key)
+        
+        if cached is None:
+            search_results = self.search_keywords_in_pdf(doc, keywords, edition_number)
+            if not search_results["success"]:
+                return search_results
             
-            doc.close()
-            return {"success": True, "results": results, "total_pages": total_pages}
+            cached = {
+                "total_pages": search_results["total_pages"],
+                "results": {normalized[keyword]: data for keyword, data in search_results["results"].items()},
+            }
+            with self._search_lock:
+                # Termos livres do /buscar criam uma entrada cada: limita o total de pesquisas
+                self._search_cache[cache_key] = cached
+                self._search_cache.move_to_end(cache_key)
+                while len(self._search_cache) > SEARCH_CACHE_SIZE:
+                    self._search_cache.popitem(last=False)
+            return search_results
+        
+        logger.info(f"Usando pesquisa em cache da edição {edition_number}")
+        return {
+            "success": True,
+            "results": {keyword: dict(cached["results"][normalized[keyword]]) for keyword in keywords},
+            "total_pages": cached["total_pages"],
+        }
+
+    def open_pdf(self, pdf_path: str) -> fitz.Document | None:
+        """Abre o PDF do cache (lido do disco sob demanda)."""
+        try:
+            return fitz.open(pdf_path)
+        except Exception as e:
+            logger.error(f"Erro ao abrir PDF: {e}")
+            return None
+
+    def extract_page_texts(self, doc: fitz.Document) -> list:
+        """Extrai o texto de todas as páginas do PDF (em paralelo nos PDFs grandes)."""
+        total_pages = len(doc)
+
+        # Divide as páginas entre os processos (PDFs pequenos são lidos aqui mesmo)
+        workers = min(os.cpu_count() or 1, -(-total_pages // MIN_PAGES_PER_WORKER))
+        if workers <= 1:
+            return _extract_page_texts(doc, 0, total_pages)
+
+        # Cada processo abre o mesmo arquivo do cache e lê apenas o seu intervalo
+        pdf_path = doc.name
+        chunk_size = -(-total_pages // workers)
+        ranges = [(start, min(start + chunk_size, total_pages)) for start in range(0, total_pages, chunk_size)]
+        executor = self.get_process_pool()
+        try:
+            futures = [
+                executor.submit(_extract_page_range, pdf_path, start, end)
+                for start, end in ranges
+            ]
+            return [page_text for future in futures for page_text in future.result()]
+        except BrokenProcessPool as e:
+            # Um processo morreu: descarta o pool (o próximo é criado de novo) e lê aqui mesmo
+            logger.warning(f"Pool de processos quebrado, extraindo sem paralelismo: {e}")
+            with self._pool_lock:
+                if self._process_pool is executor:
+                    self._process_pool = None
+            executor.shutdown(wait=False, cancel_futures=True)
+            return _extract_page_texts(doc, 0, total_pages)
+
+    def get_process_pool(self) -> ProcessPoolExecutor:
+        """Retorna o pool de processos da extração, mantido entre as pesquisas."""
+        with self._pool_lock:
+            if self._process_pool is None:
+                # "spawn" em todos os sistemas: fork de um processo com threads (PTB, PDF_POOL) pode travar
+                self._process_pool = ProcessPoolExecutor(
+                    max_workers=os.cpu_count() or 1,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._process_pool
+
+    def shutdown_process_pool(self) -> None:
+        """Encerra os processos da extração paralela."""
+        with self._pool_lock:
+            if self._process_pool is not None:
+                self._process_pool.shutdown(cancel_futures=True)
+                self._process_pool = None
+
+    def get_page_texts(self, edition_number: str, doc: fitz.Document) -> list:
+        """Retorna o texto das páginas da edição, extraindo o PDF apenas na primeira pesquisa."""
+        with self._search_lock:
+            page_texts = self._page_text_cache.get(edition_number)
+        if page_texts is not None:
+            return page_texts
+
+        page_texts = self.extract_page_texts(doc)
+        with self._search_lock:
+            # Mantém apenas o texto das últimas edições pesquisadas
+            if edition_number not in self._page_text_cache and len(self._page_text_cache) >= SEARCH_CACHE_EDITIONS:
+                del self._page_text_cache[next(iter(self._page_text_cache))]
+            self._page_text_cache[edition_number] = page_texts
+        return page_texts
+
+    def search_keywords_in_pdf(self, doc: fitz.Document, keywords: list, edition_number: str = None) -> dict:
+        """Pesquisa palavras-chave no PDF e retorna ocorrências."""
+        try:
+            # Com o número da edição, o texto extraído fica em cache para as próximas pesquisas
+            if edition_number:
+                page_texts = self.get_page_texts(edition_number, doc)
+            else:
+                page_texts = self.extract_page_texts(doc)
+
+            results = _scan_page_texts(page_texts, keywords)
+            return {"success": True, "results": results, "total_pages": len(page_texts)}
             
         except Exception as e:
             logger.error(f"Erro ao processar PDF: {e}")
             return {"success": False, "error": str(e)}
 
-    def highlight_keywords_in_pdf(self, pdf_bytes: BytesIO, keywords: list, found_results: dict) -> BytesIO | None:
-        """Destaca as palavras-chave e extrai APENAS as páginas que contêm as palavras."""
+    def highlight_keywords_in_pdf(self, doc: fitz.Document, keywords: list, found_results: dict) -> BytesIO | None:
+        """Destaca as palavras-chave e extrai APENAS as páginas que contêm as palavras.
+
+        O documento recebido é reduzido às páginas relevantes; quem abriu deve fechá-lo.
+        """
         try:
-            pdf_bytes.seek(0)
-            doc = fitz.open(stream=pdf_bytes.read(), filetype="pdf")
-            
             # Coleta todas as páginas que têm palavras-chave
             pages_with_keywords = set()
             for keyword, data in found_results.items():
@@ -324,7 +856,6 @@ class DiarioOficialBot:
                         pages_with_keywords.add(page - 1)  # Converte para índice 0-based
             
             if not pages_with_keywords:
-                doc.close()
                 return None
             
             # Cores diferentes para cada palavra-chave
@@ -338,46 +869,47 @@ class DiarioOficialBot:
                 (0.5, 1, 1),    # Ciano
             ]
             
-            # Cria novo documento apenas com as páginas relevantes
-            new_doc = fitz.open()
+            # Posições das ocorrências encontradas na pesquisa, agrupadas por página
+            spans_by_page = {}
+            for idx, keyword in enumerate(keywords):
+                data = found_results.get(keyword, {})
+                if data.get("count", 0) > 0:
+                    keyword_normalized = normalize_text(' '.join(keyword.split()))
+                    for page, (start, end) in data.get("spans", []):
+                        spans_by_page.setdefault(page - 1, []).append((idx, keyword_normalized, start, end))
+            
+            # Mantém apenas as páginas relevantes, em uma única operação
+            pages_sorted = [page_num for page_num in sorted(pages_with_keywords) if page_num < len(doc)]
+            doc.select(pages_sorted)
             highlighted_count = 0
             
-            for page_num in sorted(pages_with_keywords):
-                if page_num < len(doc):
-                    # Copia a página para o novo documento
-                    new_doc.insert_pdf(doc, from_page=page_num, to_page=page_num)
+            for new_idx, page_num in enumerate(pages_sorted):
+                new_page = doc[new_idx]
+                
+                # Extrai o texto da página uma única vez, com a posição de cada caractere
+                page_text, boxes = _page_text_boxes(new_page)
+                
+                # Destaca as palavras-chave nas posições já encontradas pela pesquisa
+                for idx, keyword_normalized, start, end in spans_by_page.get(page_num, []):
+                    if page_text[start:end] != keyword_normalized:
+                        continue
                     
-                    # Pega a página no novo documento (última adicionada)
-                    new_page = new_doc[-1]
+                    # Um retângulo por linha (a palavra-chave pode quebrar de linha)
+                    line_rects = {}
+                    for box in boxes[start:end]:
+                        if box is not None:
+                            line, bbox = box
+                            line_rects[line] = line_rects.get(line, fitz.Rect(bbox)) | fitz.Rect(bbox)
                     
-                    # Destaca as palavras-chave
-                    for idx, keyword in enumerate(keywords):
-                        if found_results.get(keyword, {}).get("count", 0) > 0:
-                            color = colors[idx % len(colors)]
-                            
-                            # Busca a palavra-chave inteira primeiro
-                            text_instances = new_page.search_for(keyword, quads=True)
-                            
-                            # Se não encontrar, busca cada palavra individualmente
-                            # (para casos onde o texto está quebrado em linhas)
-                            if not text_instances:
-                                words = keyword.split()
-                                for word in words:
-                                    if len(word) >= 3:  # Ignora palavras muito curtas
-                                        word_instances = new_page.search_for(word, quads=True)
-                                        text_instances.extend(word_instances)
-                            
-                            for inst in text_instances:
-                                highlight = new_page.add_highlight_annot(inst)
-                                highlight.set_colors(stroke=color)
-                                highlight.update()
-                                highlighted_count += 1
+                    highlight = new_page.add_highlight_annot(list(line_rects.values()))
+                    highlight.set_colors(stroke=colors[idx % len(colors)])
+                    highlight.update()
+                    highlighted_count += 1
             
-            # Salva PDF modificado
+            # Salva PDF modificado: garbage=4 remove os objetos das páginas descartadas e junta
+            # os repetidos (cabeçalhos, brasões, fontes); clean e deflate reduzem o restante
             output = BytesIO()
-            new_doc.save(output)
-            new_doc.close()
-            doc.close()
+            doc.save(output, garbage=4, deflate=True, deflate_images=True, clean=True)
             output.seek(0)
             
             logger.info(f"PDF destacado com {highlighted_count} ocorrências em {len(pages_with_keywords)} páginas")
@@ -387,9 +919,157 @@ class DiarioOficialBot:
             logger.error(f"Erro ao destacar PDF: {e}")
             return None
 
+    def shrink_pdf(self, pdf: BytesIO) -> BytesIO | None:
+        """Reduz o PDF reamostrando as imagens (máx. MAX_IMAGE_DPI) e recomprimindo-as em JPEG.
+
+        Retorna None se o resultado não ficar menor nem couber no limite do Telegram.
+        """
+        try:
+            original_size = pdf.getbuffer().nbytes
+            with fitz.open(stream=pdf.getvalue(), filetype="pdf") as doc:
+                done = set()
+                for page in doc:
+                    for image in page.get_images(full=True):
+                        xref, smask = image[0], image[1]
+                        # Imagens com transparência (máscara) ficam como estão
+                        if xref in done or smask:
+                            continue
+                        done.add(xref)
+                        
+                        # Imagem que não dá para converter (ex.: máscara sem cores) fica como está
+                        try:
+                            rects = page.get_image_rects(xref)
+                            pix = fitz.Pixmap(doc, xref)
+                            if pix.alpha:
+                                pix = fitz.Pixmap(pix, 0)
+                            if pix.colorspace and pix.colorspace.n > 3:
+                                pix = fitz.Pixmap(fitz.csRGB, pix)
+                            
+                            # Resolução em que a imagem aparece na página (maior ocorrência)
+                            if rects:
+                                width_inches = max(rect.width for rect in rects) / 72
+                                factor = 0
+                                while width_inches > 0 and pix.width / (2 ** factor) / width_inches > MAX_IMAGE_DPI * 2:
+                                    factor += 1
+                                if factor:
+                                    pix.shrink(factor)
+                            
+                            data = pix.tobytes("jpeg", jpg_quality=SHRINK_JPEG_QUALITY)
+                            if len(data) < len(doc.xref_stream_raw(xref) or b""):
+                                page.replace_image(xref, stream=data)
+                        except Exception as e:
+                            logger.warning(f"Imagem {xref} não reduzida: {e}")
+                            continue
+                
+                output = BytesIO()
+                doc.save(output, garbage=4, deflate=True, deflate_images=True, clean=True)
+            
+            size = output.getbuffer().nbytes
+            logger.info(f"PDF reduzido de {original_size / 1e6:.1f}MB para {size / 1e6:.1f}MB")
+            if size >= original_size or size > TELEGRAM_UPLOAD_LIMIT:
+                return None
+            output.seek(0)
+            return output
+            
+        except Exception as e:
+            logger.error(f"Erro ao reduzir PDF: {e}")
+            return None
+
 
 # Instância global do bot
-diario_bot = DiarioOficialBot()
+# Os processos da extração importam este módulo de novo (spawn) e não usam o bot
+diario_bot = DiarioOficialBot() if multiprocessing.current_process().name == "MainProcess" else None
+
+
+async def run_pdf_task(func, *args, **kwargs):
+    """Executa trabalho pesado de PDF no PDF_POOL, sem bloquear o loop do bot."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(PDF_POOL, functools.partial(func, *args, **kwargs))
+
+
+def pdf_document(pdf_file, filename: str) -> InputFile:
+    """Prepara o PDF para envio: o arquivo é lido em partes durante o upload, sem cópia inteira na memória."""
+    return InputFile(pdf_file, filename=filename, read_file_handle=False)
+
+
+# /buscar em andamento, por (edição, termo normalizado): chamadas iguais aguardam o mesmo trabalho
+_inflight_searches = {}
+
+
+async def _run_quick_search(flight: dict, pdf_path: str, edition_number: str, search_term: str) -> None:
+    """Abre o PDF, pesquisa e destaca o termo, publicando o resultado de cada etapa em flight.
+
+    O documento pertence a esta tarefa: só é fechado quando o destaque termina,
+    mesmo que o comando que iniciou a busca seja cancelado.
+    """
+    doc = None
+    try:
+        doc = await run_pdf_task(diario_bot.open_pdf, pdf_path)
+        if not doc:
+            flight["search"].set_result(None)
+            flight["highlight"].set_result(None)
+            return
+        
+        search_results = await run_pdf_task(diario_bot.search_edition, edition_number, doc, [search_term])
+        flight["search"].set_result(search_results)
+        
+        highlighted_pdf = None
+        if search_results["success"] and search_results["results"][search_term]["count"] > 0:
+            highlighted_pdf = await run_pdf_task(
+                diario_bot.highlight_keywords_in_pdf, doc, [search_term], search_results["results"]
+            )
+        flight["highlight"].set_result(highlighted_pdf.getvalue() if highlighted_pdf else None)
+    except Exception as e:
+        logger.error(f"Erro na busca de '{search_term}': {e}")
+        if not flight["search"].done():
+            # Sem resultado da pesquisa ninguém espera pelo destaque
+            flight["search"].set_exception(e)
+            flight["highlight"].cancel()
+        elif not flight["highlight"].done():
+            flight["highlight"].set_exception(e)
+    finally:
+        if doc:
+            await run_pdf_task(doc.close)
+
+
+def start_quick_search(key: tuple, pdf_path: str, edition_number: str, search_term: str) -> dict:
+    """Inicia a busca em segundo plano e a registra para que chamadas iguais a reaproveitem."""
+    loop = asyncio.get_running_loop()
+    flight = {"search": loop.create_future(), "highlight": loop.create_future()}
+    for future in flight.values():
+        # O erro já vai para o log; evita o aviso de exceção não lida quando ninguém mais espera
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+    flight["task"] = asyncio.create_task(_run_quick_search(flight, pdf_path, edition_number, search_term))
+    flight["task"].add_done_callback(lambda _: _inflight_searches.pop(key, None))
+    _inflight_searches[key] = flight
+    return flight
+
+
+async def reply_highlighted_pdf(message, pdf: BytesIO, filename: str, caption: str) -> bool:
+    """Responde com o PDF destacado; acima do limite do Telegram, tenta uma versão reduzida.
+
+    Retorna False se nem a versão reduzida puder ser enviada.
+    """
+    # Acima do limite o envio certamente falha: reduz antes de tentar
+    if pdf.getbuffer().nbytes <= TELEGRAM_UPLOAD_LIMIT:
+        try:
+            await message.reply_document(document=pdf_document(pdf, filename), caption=caption)
+            return True
+        except NetworkError as e:
+            if "Request Entity Too Large" not in str(e):
+                raise e
+    
+    logger.info("PDF destacado acima do limite do Telegram, reduzindo imagens...")
+    smaller_pdf = await run_pdf_task(diario_bot.shrink_pdf, pdf)
+    if not smaller_pdf:
+        return False
+    try:
+        await message.reply_document(document=pdf_document(smaller_pdf, filename), caption=caption)
+        return True
+    except NetworkError as e:
+        if "Request Entity Too Large" not in str(e):
+            raise e
+        return False
 
 
 def get_user_keywords(user_id: int) -> list:
@@ -413,7 +1093,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     # Inicializa palavras-chave vazia para novo usuário
     if user_id not in diario_bot.user_keywords:
         diario_bot.user_keywords[user_id] = []
-        diario_bot.save_subscribers()
+        diario_bot.mark_dirty()
     
     user_keywords = get_user_keywords(user_id)
     
@@ -463,7 +1143,7 @@ async def get_edition(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
     """Comando /edicao - Mostra informações da edição atual."""
     await update.message.reply_text("🔍 Buscando edição atual...")
     
-    info = diario_bot.get_current_edition_info()
+    info = await asyncio.to_thread(diario_bot.get_current_edition_info)
     
     if info["success"]:
         message = f"""
@@ -485,22 +1165,21 @@ async def download_edition(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     """Comando /baixar - Baixa o PDF da edição atual."""
     await update.message.reply_text("⏳ Baixando PDF... Isso pode demorar alguns segundos.")
     
-    info = diario_bot.get_current_edition_info()
+    info = await asyncio.to_thread(diario_bot.get_current_edition_info)
     
     if not info["success"]:
         await update.message.reply_text(f"❌ Erro: {info['error']}")
         return
     
-    pdf_bytes = diario_bot.download_pdf(info["pdf_url"], info["edition_number"])
+    pdf_path = await asyncio.to_thread(diario_bot.download_pdf, info["pdf_url"], info["edition_number"])
     
-    if pdf_bytes:
-        pdf_bytes.seek(0)
+    if pdf_path:
         try:
-            await update.message.reply_document(
-                document=pdf_bytes,
-                filename=f"DM_{info['edition_number']}.pdf",
-                caption=f"📰 Diário Oficial - Edição {info['edition_number']} ({info['edition_date']})"
-            )
+            with open(pdf_path, "rb") as pdf_file:
+                await update.message.reply_document(
+                    document=pdf_document(pdf_file, f"DM_{info['edition_number']}.pdf"),
+                    caption=f"📰 Diário Oficial - Edição {info['edition_number']} ({info['edition_date']})"
+                )
         except NetworkError as e:
             if "Request Entity Too Large" in str(e):
                 await update.message.reply_text(
@@ -542,11 +1221,13 @@ async def add_keyword(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
     if user_id not in diario_bot.user_keywords:
         diario_bot.user_keywords[user_id] = DEFAULT_KEYWORDS.copy()
     
-    if keyword.lower() in [kw.lower() for kw in diario_bot.user_keywords[user_id]]:
+    keyword_lower = keyword.lower()
+    if any(kw.lower() == keyword_lower for kw in diario_bot.user_keywords[user_id]):
         await update.message.reply_text(f"⚠️ A palavra-chave '{keyword}' já existe.")
         return
     
     diario_bot.user_keywords[user_id].append(keyword)
+    diario_bot.mark_dirty()
     await update.message.reply_text(f"✅ Palavra-chave '{keyword}' adicionada com sucesso!")
 
 
@@ -566,9 +1247,11 @@ async def remove_keyword(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     keywords = diario_bot.user_keywords[user_id]
     
     # Procura case-insensitive
+    keyword_lower = keyword.lower()
     for kw in keywords:
-        if kw.lower() == keyword.lower():
+        if kw.lower() == keyword_lower:
             diario_bot.user_keywords[user_id].remove(kw)
+            diario_bot.mark_dirty()
             await update.message.reply_text(f"✅ Palavra-chave '{kw}' removida com sucesso!")
             return
     
@@ -579,12 +1262,13 @@ async def clear_keywords(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     """Comando /limpar - Remove todas as palavras-chave."""
     user_id = update.effective_user.id
     diario_bot.user_keywords[user_id] = []
+    diario_bot.mark_dirty()
     await update.message.reply_text("✅ Todas as palavras-chave foram removidas.")
 
 
 async def clear_cache(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Comando /cache - Limpa o cache de PDFs."""
-    count = diario_bot.clear_cache()
+    count = await asyncio.to_thread(diario_bot.clear_cache)
     if count > 0:
         await update.message.reply_text(f"🗑️ Cache limpo! {count} arquivo(s) removido(s).\nO próximo download irá baixar o PDF atualizado.")
     else:
@@ -606,7 +1290,7 @@ async def search_keywords(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         return
     
     # Obtém informações da edição
-    info = diario_bot.get_current_edition_info()
+    info = await asyncio.to_thread(diario_bot.get_current_edition_info)
     if not info["success"]:
         await update.message.reply_text(f"❌ Erro: {info['error']}")
         return
@@ -619,55 +1303,67 @@ async def search_keywords(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         await update.message.reply_text("🔍 Baixando e analisando PDF... Aguarde (pode demorar alguns minutos).")
     
     # Baixa o PDF (usa cache se disponível)
-    pdf_bytes = diario_bot.download_pdf(info["pdf_url"], info["edition_number"])
-    if not pdf_bytes:
+    pdf_path = await asyncio.to_thread(diario_bot.download_pdf, info["pdf_url"], info["edition_number"])
+    if not pdf_path:
         await update.message.reply_text("❌ Erro ao baixar o PDF.")
         return
     
-    # Pesquisa palavras-chave
-    search_results = diario_bot.search_keywords_in_pdf(pdf_bytes, keywords)
-    
-    if not search_results["success"]:
-        await update.message.reply_text(f"❌ Erro ao processar PDF: {search_results['error']}")
+    # Abre o PDF uma única vez para a pesquisa e para o destaque
+    doc = await run_pdf_task(diario_bot.open_pdf, pdf_path)
+    if not doc:
+        await update.message.reply_text("❌ Erro ao abrir o PDF.")
         return
     
-    # Monta mensagem de resultado
-    message = f"📰 *Resultado da Pesquisa*\n"
-    message += f"📅 Edição {info['edition_number']} - {info['edition_date']}\n"
-    message += f"📄 Total de páginas: {search_results['total_pages']}\n\n"
-    
-    found_any = False
-    found_keywords = []
-    
-    for keyword, data in search_results["results"].items():
-        if data["count"] > 0:
-            found_any = True
-            found_keywords.append(keyword)
-            pages_str = ", ".join(map(str, data["pages"][:10]))  # Máximo 10 páginas
-            message += f"✅ *{keyword}*\n"
-            message += f"   📊 Ocorrências: {data['count']}\n"
-            message += f"   📄 Páginas: {pages_str}\n"
-            
-            if data["contexts"]:
-                message += f"   📝 Contexto:\n"
-                for ctx in data["contexts"][:2]:  # Máximo 2 contextos
-                    ctx_clean = ctx[:150].replace("*", "").replace("_", "").replace("`", "")
-                    message += f"   _{ctx_clean}..._\n"
-            message += "\n"
-        else:
-            message += f"❌ *{keyword}*: Não encontrado\n\n"
-    
-    await update.message.reply_text(message, parse_mode="Markdown")
-    
-    # Se encontrou algo, gera PDF com destaques
-    if found_any:
-        await update.message.reply_text("✨ Gerando PDF com palavras destacadas (apenas páginas relevantes)...")
+    try:
+        # Pesquisa palavras-chave
+        search_results = await run_pdf_task(
+            diario_bot.search_edition, info["edition_number"], doc, keywords
+        )
+        
+        if not search_results["success"]:
+            await update.message.reply_text(f"❌ Erro ao processar PDF: {search_results['error']}")
+            return
+        
+        # Monta mensagem de resultado
+        message_parts = [
+            "📰 *Resultado da Pesquisa*",
+            f"📅 Edição {info['edition_number']} - {info['edition_date']}",
+            f"📄 Total de páginas: {search_results['total_pages']}",
+            "",
+        ]
+        
+        found_any = False
+        found_keywords = []
+        
+        for keyword, data in search_results["results"].items():
+            if data["count"] > 0:
+                found_any = True
+                found_keywords.append(keyword)
+                pages_str = ", ".join(map(str, data["pages"][:10]))  # Máximo 10 páginas
+                message_parts.append(f"✅ *{keyword}*")
+                message_parts.append(f"   📊 Ocorrências: {data['count']}")
+                message_parts.append(f"   📄 Páginas: {pages_str}")
+                
+                if data["contexts"]:
+                    message_parts.append("   📝 Contexto:")
+                    for ctx in data["contexts"][:2]:  # Máximo 2 contextos
+                        ctx_clean = _MARKDOWN_RE.sub('', ctx[:150])
+                        message_parts.append(f"   _{ctx_clean}..._")
+                message_parts.append("")
+            else:
+                message_parts.append(f"❌ *{keyword}*: Não encontrado")
+                message_parts.append("")
+        
+        await update.message.reply_text("\n".join(message_parts), parse_mode="Markdown")
         
-        # Baixa o PDF novamente para destacar (usa cache)
-        pdf_bytes = diario_bot.download_pdf(info["pdf_url"], info["edition_number"])
-        if pdf_bytes:
-            highlighted_pdf = diario_bot.highlight_keywords_in_pdf(
-                pdf_bytes, 
+        # Se encontrou algo, gera PDF com destaques
+        if found_any:
+            await update.message.reply_text("✨ Gerando PDF com palavras destacadas (apenas páginas relevantes)...")
+            
+            # Destaca no mesmo PDF já aberto para a pesquisa
+            highlighted_pdf = await run_pdf_task(
+                diario_bot.highlight_keywords_in_pdf,
+                doc, 
                 keywords, 
                 search_results["results"]
             )
@@ -678,34 +1374,30 @@ async def search_keywords(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                 for kw, data in search_results["results"].items():
                     pages_found.update(data.get("pages", []))
                 
-                try:
-                    await update.message.reply_document(
-                        document=highlighted_pdf,
-                        filename=f"DM_{info['edition_number']}_DESTACADO.pdf",
-                        caption=f"📰 Edição {info['edition_number']}\n📄 Contém apenas {len(pages_found)} página(s) com as palavras encontradas\n🔍 Destacado: {', '.join(found_keywords)}"
+                sent = await reply_highlighted_pdf(
+                    update.message,
+                    highlighted_pdf,
+                    f"DM_{info['edition_number']}_DESTACADO.pdf",
+                    f"📰 Edição {info['edition_number']}\n📄 Contém apenas {len(pages_found)} página(s) com as palavras encontradas\n🔍 Destacado: {', '.join(found_keywords)}"
+                )
+                if not sent:
+                    await update.message.reply_text(
+                        f"❌ *Arquivo muito grande!*\n\n"
+                        f"O PDF com {len(pages_found)} páginas destacadas excede o limite de 50MB do Telegram.\n\n"
+                        f"📄 *Páginas encontradas:*\n{', '.join(map(str, sorted(pages_found)[:50]))}"
+                        f"{'...' if len(pages_found) > 50 else ''}\n\n"
+                        f"💡 Tente pesquisar termos mais específicos para reduzir o número de páginas.",
+                        parse_mode="Markdown"
                     )
-                except NetworkError as e:
-                    if "Request Entity Too Large" in str(e):
-                        await update.message.reply_text(
-                            f"❌ *Arquivo muito grande!*\n\n"
-                            f"O PDF com {len(pages_found)} páginas destacadas excede o limite de 50MB do Telegram.\n\n"
-                            f"📄 *Páginas encontradas:*\n{', '.join(map(str, sorted(pages_found)[:50]))}"
-                            f"{'...' if len(pages_found) > 50 else ''}\n\n"
-                            f"💡 Tente pesquisar termos mais específicos para reduzir o número de páginas.",
-                            parse_mode="Markdown"
-                        )
-                    else:
-                        raise e
             else:
                 await update.message.reply_text("⚠️ Não foi possível gerar o PDF destacado. Enviando PDF original...")
-                pdf_bytes = diario_bot.download_pdf(info["pdf_url"], info["edition_number"])
-                if pdf_bytes:
-                    pdf_bytes.seek(0)
+                with open(pdf_path, "rb") as pdf_file:
                     await update.message.reply_document(
-                        document=pdf_bytes,
-                        filename=f"DM_{info['edition_number']}.pdf",
+                        document=pdf_document(pdf_file, f"DM_{info['edition_number']}.pdf"),
                         caption=f"📰 Diário Oficial - Edição {info['edition_number']}"
                     )
+    finally:
+        await run_pdf_task(doc.close)
 
 
 async def quick_search(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -717,82 +1409,101 @@ async def quick_search(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     search_term = " ".join(context.args).strip()
     
     # Obtém informações da edição
-    info = diario_bot.get_current_edition_info()
+    info = await asyncio.to_thread(diario_bot.get_current_edition_info)
     if not info["success"]:
         await update.message.reply_text(f"❌ Erro: {info['error']}")
         return
     
-    # Verifica se já tem cache
-    has_cache = diario_bot.get_cached_pdf(info["edition_number"]) is not None
-    if has_cache:
-        await update.message.reply_text(f"🔍 Buscando '{search_term}' (usando cache)... Aguarde.")
+    # Buscas simultâneas do mesmo termo (sem acentos/maiúsculas) na mesma edição são feitas uma vez só
+    flight_key = (info["edition_number"], normalize_text(' '.join(search_term.split())))
+    flight = _inflight_searches.get(flight_key)
+    
+    if flight is not None:
+        await update.message.reply_text(f"🔍 Buscando '{search_term}' (busca igual já em andamento)... Aguarde.")
     else:
-        await update.message.reply_text(f"🔍 Baixando PDF e buscando '{search_term}'... Aguarde (pode demorar alguns minutos).")
+        # Verifica se já tem cache
+        has_cache = diario_bot.get_cached_pdf(info["edition_number"]) is not None
+        if has_cache:
+            await update.message.reply_text(f"🔍 Buscando '{search_term}' (usando cache)... Aguarde.")
+        else:
+            await update.message.reply_text(f"🔍 Baixando PDF e buscando '{search_term}'... Aguarde (pode demorar alguns minutos).")
+        
+        # Baixa o PDF (usa cache se disponível)
+        pdf_path = await asyncio.to_thread(diario_bot.download_pdf, info["pdf_url"], info["edition_number"])
+        if not pdf_path:
+            await update.message.reply_text("❌ Erro ao baixar o PDF.")
+            return
+        
+        # Pesquisa e destaca o termo em segundo plano (outra chamada igual pode ter começado durante o download)
+        flight = _inflight_searches.get(flight_key) or start_quick_search(
+            flight_key, pdf_path, info["edition_number"], search_term
+        )
     
-    # Baixa o PDF (usa cache se disponível)
-    pdf_bytes = diario_bot.download_pdf(info["pdf_url"], info["edition_number"])
-    if not pdf_bytes:
-        await update.message.reply_text("❌ Erro ao baixar o PDF.")
+    # shield: se este comando for cancelado, a busca continua para quem a aguarda
+    try:
+        search_results = await asyncio.shield(flight["search"])
+    except Exception as e:
+        await update.message.reply_text(f"❌ Erro ao processar PDF: {e}")
+        return
+    if search_results is None:
+        await update.message.reply_text("❌ Erro ao abrir o PDF.")
         return
-    
-    # Pesquisa o termo
-    search_results = diario_bot.search_keywords_in_pdf(pdf_bytes, [search_term])
     
     if not search_results["success"]:
         await update.message.reply_text(f"❌ Erro ao processar PDF: {search_results['error']}")
         return
     
-    # Monta mensagem de resultado
-    data = search_results["results"][search_term]
+    # Monta mensagem de resultado (o termo pode ter sido digitado de outro jeito por quem iniciou a busca)
+    data = next(iter(search_results["results"].values()))
     
     if data["count"] > 0:
         pages_str = ", ".join(map(str, data["pages"][:15]))
-        message = f"✅ *Termo encontrado!*\n\n"
-        message += f"🔑 *{search_term}*\n"
-        message += f"📊 Ocorrências: {data['count']}\n"
-        message += f"📄 Páginas: {pages_str}\n\n"
+        message_parts = [
+            "✅ *Termo encontrado!*",
+            "",
+            f"🔑 *{search_term}*",
+            f"📊 Ocorrências: {data['count']}",
+            f"📄 Páginas: {pages_str}",
+            "",
+        ]
         
         if data["contexts"]:
-            message += f"📝 *Contextos:*\n"
+            message_parts.append("📝 *Contextos:*")
             for ctx in data["contexts"][:3]:
-                ctx_clean = ctx[:200].replace("*", "").replace("_", "").replace("`", "")
-                message += f"• _{ctx_clean}_\n\n"
+                ctx_clean = _MARKDOWN_RE.sub('', ctx[:200])
+                message_parts.append(f"• _{ctx_clean}_")
+                message_parts.append("")
         
-        await update.message.reply_text(message, parse_mode="Markdown")
+        await update.message.reply_text("\n".join(message_parts), parse_mode="Markdown")
         
         # Gera PDF com destaque
         await update.message.reply_text("✨ Gerando PDF com termo destacado (apenas páginas relevantes)...")
         
-        pdf_bytes = diario_bot.download_pdf(info["pdf_url"], info["edition_number"])
-        if pdf_bytes:
-            highlighted_pdf = diario_bot.highlight_keywords_in_pdf(
-                pdf_bytes, 
-                [search_term], 
-                search_results["results"]
+        try:
+            highlighted_pdf = await asyncio.shield(flight["highlight"])
+        except Exception as e:
+            await update.message.reply_text(f"❌ Erro ao gerar PDF destacado: {e}")
+            return
+        
+        if highlighted_pdf:
+            pages_count = len(data.get("pages", []))
+            pages_list = data.get("pages", [])
+            sent = await reply_highlighted_pdf(
+                update.message,
+                BytesIO(highlighted_pdf),  # Cada envio lê sua própria cópia do PDF compartilhado
+                f"DM_{info['edition_number']}_DESTACADO.pdf",
+                f"📰 Edição {info['edition_number']}\n📄 Contém apenas {pages_count} página(s) com o termo\n🔍 Destacado: {search_term}"
             )
-            
-            if highlighted_pdf:
-                pages_count = len(data.get("pages", []))
-                pages_list = data.get("pages", [])
-                try:
-                    await update.message.reply_document(
-                        document=highlighted_pdf,
-                        filename=f"DM_{info['edition_number']}_DESTACADO.pdf",
-                        caption=f"📰 Edição {info['edition_number']}\n📄 Contém apenas {pages_count} página(s) com o termo\n🔍 Destacado: {search_term}"
-                    )
-                except NetworkError as e:
-                    if "Request Entity Too Large" in str(e):
-                        await update.message.reply_text(
-                            f"❌ *Arquivo muito grande!*\n\n"
-                            f"O PDF com {pages_count} páginas destacadas excede o limite de 50MB do Telegram.\n\n"
-                            f"📄 *Páginas onde '*{search_term}*' foi encontrado:*\n"
-                            f"{', '.join(map(str, sorted(pages_list)[:50]))}"
-                            f"{'...' if len(pages_list) > 50 else ''}\n\n"
-                            f"💡 Tente pesquisar termos mais específicos para reduzir o número de páginas.",
-                            parse_mode="Markdown"
-                        )
-                    else:
-                        raise e
+            if not sent:
+                await update.message.reply_text(
+                    f"❌ *Arquivo muito grande!*\n\n"
+                    f"O PDF com {pages_count} páginas destacadas excede o limite de 50MB do Telegram.\n\n"
+                    f"📄 *Páginas onde '*{search_term}*' foi encontrado:*\n"
+                    f"{', '.join(map(str, sorted(pages_list)[:50]))}"
+                    f"{'...' if len(pages_list) > 50 else ''}\n\n"
+                    f"💡 Tente pesquisar termos mais específicos para reduzir o número de páginas.",
+                    parse_mode="Markdown"
+                )
     else:
         message = f"❌ Termo '*{search_term}*' não encontrado na edição {info['edition_number']}."
         await update.message.reply_text(message, parse_mode="Markdown")
@@ -809,16 +1520,15 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         
         await query.message.reply_text("⏳ Baixando PDF...")
         
-        pdf_bytes = diario_bot.download_pdf(pdf_url, edition_number)
+        pdf_path = await asyncio.to_thread(diario_bot.download_pdf, pdf_url, edition_number)
         
-        if pdf_bytes:
-            pdf_bytes.seek(0)
+        if pdf_path:
             try:
-                await query.message.reply_document(
-                    document=pdf_bytes,
-                    filename=f"DM_{edition_number}.pdf",
-                    caption=f"📰 Diário Oficial - Edição {edition_number}"
-                )
+                with open(pdf_path, "rb") as pdf_file:
+                    await query.message.reply_document(
+                        document=pdf_document(pdf_file, f"DM_{edition_number}.pdf"),
+                        caption=f"📰 Diário Oficial - Edição {edition_number}"
+                    )
             except NetworkError as e:
                 if "Request Entity Too Large" in str(e):
                     await query.message.reply_text(
@@ -854,32 +1564,57 @@ async def unsubscribe(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         )
 
 
+async def send_rate_limited(send, chat_id: int, **kwargs):
+    """Chama bot.send_* respeitando os limites do Telegram.
+
+    Se mesmo assim o Telegram pedir para aguardar (RetryAfter), espera e tenta mais uma vez.
+    """
+    for attempt in range(2):
+        async with GLOBAL_SEND_LIMITER, CHAT_SEND_LIMITERS[chat_id]:
+            try:
+                return await send(chat_id=chat_id, **kwargs)
+            except RetryAfter as e:
+                if attempt:
+                    raise
+                retry_after = e.retry_after
+        if isinstance(retry_after, timedelta):
+            retry_after = retry_after.total_seconds()
+        logger.warning(f"Limite do Telegram atingido para {chat_id}. Aguardando {retry_after}s")
+        await asyncio.sleep(retry_after)
+
+
 async def send_notification_to_all(bot: Bot, message: str, parse_mode: str = "Markdown") -> int:
     """Envia notificação para todos os usuários inscritos."""
     if not diario_bot.subscribers:
         logger.warning("Nenhum usuário inscrito. Notificação não enviada.")
         return 0
     
-    sent_count = 0
     failed_chats = []
+    semaphore = asyncio.Semaphore(BROADCAST_CONCURRENCY)
     
-    for chat_id in diario_bot.subscribers.copy():
-        try:
-            await bot.send_message(
-                chat_id=chat_id,
-                text=message,
-                parse_mode=parse_mode
-            )
-            sent_count += 1
-        except Exception as e:
-            logger.error(f"Erro ao enviar para {chat_id}: {e}")
-            # Remove usuários que bloquearam o bot ou não existem mais
-            if "bot was blocked" in str(e).lower() or "chat not found" in str(e).lower():
-                failed_chats.append(chat_id)
+    async def send_one(chat_id: int) -> bool:
+        async with semaphore:
+            try:
+                await send_rate_limited(
+                    bot.send_message,
+                    chat_id,
+                    text=message,
+                    parse_mode=parse_mode
+                )
+                return True
+            except Exception as e:
+                logger.error(f"Erro ao enviar para {chat_id}: {e}")
+                # Remove usuários que bloquearam o bot ou não existem mais
+                if "bot was blocked" in str(e).lower() or "chat not found" in str(e).lower():
+                    failed_chats.append(chat_id)
+                return False
+    
+    # Envia para todos ao mesmo tempo (limitado pelo semáforo)
+    results = await asyncio.gather(*(send_one(chat_id) for chat_id in diario_bot.subscribers.copy()))
+    sent_count = sum(results)
     
     # Remove chats inválidos
-    for chat_id in failed_chats:
-        diario_bot.remove_subscriber(chat_id)
+    diario_bot.remove_subscribers_bulk(failed_chats)
     
     logger.info(f"Notificação enviada para {sent_count}/{len(diario_bot.subscribers)} usuários")
     return sent_count
@@ -891,39 +1626,76 @@ async def send_document_to_all(bot: Bot, document: BytesIO, filename: str, capti
         logger.warning("Nenhum usuário inscrito. Documento não enviado.")
         return 0
     
-    sent_count = 0
     failed_chats = []
+    semaphore = asyncio.Semaphore(BROADCAST_CONCURRENCY)
+    file_id = None  # Após o primeiro upload, o Telegram reaproveita o arquivo pelo file_id
+    # Acima do limite nenhum upload vai passar: os inscritos recebem só o aviso
+    too_large = document.getbuffer().nbytes > TELEGRAM_UPLOAD_LIMIT
     
-    for chat_id in diario_bot.subscribers.copy():
+    async def send_too_large_notice(chat_id: int) -> None:
         try:
-            document.seek(0)
-            await bot.send_document(
-                chat_id=chat_id,
-                document=document,
-                filename=filename,
-                caption=caption
+            await send_rate_limited(
+                bot.send_message,
+                chat_id,
+                text=f"⚠️ *Arquivo muito grande para enviar*\n\n{caption}\n\nO PDF excede o limite de 50MB do Telegram.",
+                parse_mode="Markdown"
             )
-            sent_count += 1
+        except:
+            pass
+    
+    async def send_one(chat_id: int) -> bool:
+        nonlocal file_id, too_large
+        if too_large:
+            await send_too_large_notice(chat_id)
+            return False
+        try:
+            if file_id:
+                await send_rate_limited(
+                    bot.send_document,
+                    chat_id,
+                    document=file_id,
+                    caption=caption
+                )
+            else:
+                document.seek(0)
+                message = await send_rate_limited(
+                    bot.send_document,
+                    chat_id,
+                    document=pdf_document(document, filename),
+                    caption=caption
+                )
+                file_id = message.document.file_id
+            return True
         except NetworkError as e:
             if "Request Entity Too Large" in str(e):
-                try:
-                    await bot.send_message(
-                        chat_id=chat_id,
-                        text=f"⚠️ *Arquivo muito grande para enviar*\n\n{caption}\n\nO PDF excede o limite de 50MB do Telegram.",
-                        parse_mode="Markdown"
-                    )
-                except:
-                    pass
+                # Não adianta repetir o upload para os demais inscritos
+                too_large = True
+                await send_too_large_notice(chat_id)
             else:
                 logger.error(f"Erro ao enviar documento para {chat_id}: {e}")
         except Exception as e:
             logger.error(f"Erro ao enviar documento para {chat_id}: {e}")
             if "bot was blocked" in str(e).lower() or "chat not found" in str(e).lower():
                 failed_chats.append(chat_id)
+        return False
+    
+    async def send_limited(chat_id: int) -> bool:
+        async with semaphore:
+            return await send_one(chat_id)
+    
+    # Faz o upload um inscrito por vez até obter o file_id (ou descobrir que o PDF é grande demais)
+    chat_ids = list(diario_bot.subscribers)
+    sent_count = 0
+    while chat_ids and not file_id and not too_large:
+        sent_count += await send_one(chat_ids.pop(0))
+    
+    # Os demais recebem o file_id (ou o aviso) ao mesmo tempo (limitado pelo semáforo)
+    if chat_ids:
+        results = await asyncio.gather(*(send_limited(chat_id) for chat_id in chat_ids))
+        sent_count += sum(results)
     
     # Remove chats inválidos
-    for chat_id in failed_chats:
-        diario_bot.remove_subscriber(chat_id)
+    diario_bot.remove_subscribers_bulk(failed_chats)
     
     logger.info(f"Documento enviado para {sent_count}/{len(diario_bot.subscribers)} usuários")
     return sent_count
@@ -957,7 +1729,7 @@ async def startup_routine(application: Application) -> None:
     )
     
     # Obtém informações da edição atual
-    info = diario_bot.get_current_edition_info()
+    info = await asyncio.to_thread(diario_bot.get_current_edition_info)
     
     if not info["success"]:
         await send_notification(
@@ -968,9 +1740,9 @@ async def startup_routine(application: Application) -> None:
     
     # Baixa o PDF
     logger.info(f"Baixando edição {info['edition_number']}...")
-    pdf_bytes = diario_bot.download_pdf(info["pdf_url"], info["edition_number"])
+    pdf_path = await asyncio.to_thread(diario_bot.download_pdf, info["pdf_url"], info["edition_number"])
     
-    if not pdf_bytes:
+    if not pdf_path:
         await send_notification(
             bot,
             "❌ *Erro ao baixar o PDF.*\nTente novamente mais tarde."
@@ -989,65 +1761,80 @@ async def startup_routine(application: Application) -> None:
     # Faz pesquisa automática com palavras-chave padrão
     logger.info(f"Pesquisando palavras-chave padrão: {DEFAULT_KEYWORDS}")
     
-    search_results = diario_bot.search_keywords_in_pdf(pdf_bytes, DEFAULT_KEYWORDS)
-    
-    if not search_results["success"]:
+    doc = await run_pdf_task(diario_bot.open_pdf, pdf_path)
+    if not doc:
         await send_notification(
             bot,
-            f"❌ *Erro na pesquisa:* {search_results['error']}"
+            "❌ *Erro ao abrir o PDF.*"
         )
         return
     
-    # Monta mensagem com resultados
-    results = search_results["results"]
-    found_keywords = []
-    message_parts = ["📊 *Resultado da pesquisa automática:*\n"]
-    message_parts.append(f"📰 Edição {info['edition_number']} ({info['edition_date']})\n")
-    
-    for keyword, data in results.items():
-        count = data["count"]
-        pages = data["pages"]
-        
-        if count > 0:
-            found_keywords.append(keyword)
-            pages_str = ", ".join(map(str, pages[:10]))
-            if len(pages) > 10:
-                pages_str += f"... (+{len(pages) - 10})"
-            message_parts.append(f"\n✅ *{keyword}*")
-            message_parts.append(f"   📍 {count} ocorrência(s) em {len(pages)} página(s)")
-            message_parts.append(f"   📄 Páginas: {pages_str}")
-        else:
-            message_parts.append(f"\n❌ *{keyword}* - não encontrado")
-    
-    # Envia resultado da pesquisa
-    await send_notification(bot, "\n".join(message_parts))
-    
-    # Se encontrou palavras, gera PDF destacado
-    if found_keywords:
-        await send_notification(
-            bot,
-            f"\n✨ Gerando PDF com {len(found_keywords)} termo(s) destacado(s)..."
+    try:
+        search_results = await run_pdf_task(
+            diario_bot.search_edition, info["edition_number"], doc, DEFAULT_KEYWORDS
         )
         
-        highlighted_pdf = diario_bot.highlight_keywords_in_pdf(
-            pdf_bytes,
-            DEFAULT_KEYWORDS,
-            results
-        )
+        if not search_results["success"]:
+            await send_notification(
+                bot,
+                f"❌ *Erro na pesquisa:* {search_results['error']}"
+            )
+            return
         
-        if highlighted_pdf:
-            pages_found = set()
-            for kw, data in results.items():
-                pages_found.update(data.get("pages", []))
+        # Monta mensagem com resultados
+        results = search_results["results"]
+        found_keywords = []
+        message_parts = ["📊 *Resultado da pesquisa automática:*\n"]
+        message_parts.append(f"📰 Edição {info['edition_number']} ({info['edition_date']})\n")
+        
+        for keyword, data in results.items():
+            count = data["count"]
+            pages = data["pages"]
             
-            await send_document_notification(
+            if count > 0:
+                found_keywords.append(keyword)
+                pages_str = ", ".join(map(str, pages[:10]))
+                if len(pages) > 10:
+                    pages_str += f"... (+{len(pages) - 10})"
+                message_parts.append(f"\n✅ *{keyword}*")
+                message_parts.append(f"   📍 {count} ocorrência(s) em {len(pages)} página(s)")
+                message_parts.append(f"   📄 Páginas: {pages_str}")
+            else:
+                message_parts.append(f"\n❌ *{keyword}* - não encontrado")
+        
+        # Envia resultado da pesquisa
+        await send_notification(bot, "\n".join(message_parts))
+        diario_bot.last_notified_edition = info["edition_number"]
+        
+        # Se encontrou palavras, gera PDF destacado
+        if found_keywords:
+            await send_notification(
                 bot,
-                highlighted_pdf,
-                f"DM_{info['edition_number']}_DESTACADO.pdf",
-                f"📰 Edição {info['edition_number']}\n"
-                f"📄 {len(pages_found)} página(s) com palavras encontradas\n"
-                f"🔍 Termos: {', '.join(found_keywords)}"
+                f"\n✨ Gerando PDF com {len(found_keywords)} termo(s) destacado(s)..."
             )
+            
+            highlighted_pdf = await run_pdf_task(
+                diario_bot.highlight_keywords_in_pdf,
+                doc,
+                DEFAULT_KEYWORDS,
+                results
+            )
+            
+            if highlighted_pdf:
+                pages_found = set()
+                for kw, data in results.items():
+                    pages_found.update(data.get("pages", []))
+                
+                await send_document_notification(
+                    bot,
+                    highlighted_pdf,
+                    f"DM_{info['edition_number']}_DESTACADO.pdf",
+                    f"📰 Edição {info['edition_number']}\n"
+                    f"📄 {len(pages_found)} página(s) com palavras encontradas\n"
+                    f"🔍 Termos: {', '.join(found_keywords)}"
+                )
+    finally:
+        await run_pdf_task(doc.close)
     
     await send_notification(
         bot,
@@ -1072,16 +1859,12 @@ async def scheduled_search(context: ContextTypes.DEFAULT_TYPE) -> None:
     await send_notification(
         bot,
         "⏰ *Pesquisa agendada das 12:00*\n\n"
-        "🗑️ Limpando cache antigo...\n"
         "⏳ Verificando nova edição..."
     )
     
-    # Limpa cache
-    deleted = diario_bot.clear_cache()
-    logger.info(f"Cache limpo: {deleted} arquivo(s) removido(s)")
-    
-    # Obtém informações da edição atual (vai buscar a mais recente)
-    info = diario_bot.get_current_edition_info()
+    # Obtém informações da edição atual (consulta o site de novo para achar a mais recente)
+    diario_bot.reset_edition_info()
+    info = await asyncio.to_thread(diario_bot.get_current_edition_info)
     
     if not info["success"]:
         await send_notification(
@@ -1090,6 +1873,20 @@ async def scheduled_search(context: ContextTypes.DEFAULT_TYPE) -> None:
         )
         return
     
+    # Mesma edição já pesquisada e enviada: não repete download, pesquisa e envio
+    if info["edition_number"] == diario_bot.last_notified_edition:
+        logger.info(f"Edição {info['edition_number']} já enviada. Pesquisa agendada ignorada.")
+        await send_notification(
+            bot,
+            f"📭 *Nenhuma edição nova.*\n\n"
+            f"📰 A edição {info['edition_number']} já foi pesquisada e enviada."
+        )
+        return
+    
+    # Edição nova: limpa o cache das anteriores (PDFs e pesquisas)
+    deleted = await asyncio.to_thread(diario_bot.clear_cache)
+    logger.info(f"Cache limpo: {deleted} arquivo(s) removido(s)")
+    
     await send_notification(
         bot,
         f"📰 *Edição encontrada:* {info['edition_number']}\n"
@@ -1098,9 +1895,9 @@ async def scheduled_search(context: ContextTypes.DEFAULT_TYPE) -> None:
     )
     
     # Baixa o PDF
-    pdf_bytes = diario_bot.download_pdf(info["pdf_url"], info["edition_number"])
+    pdf_path = await asyncio.to_thread(diario_bot.download_pdf, info["pdf_url"], info["edition_number"])
     
-    if not pdf_bytes:
+    if not pdf_path:
         await send_notification(
             bot,
             "❌ *Erro ao baixar o PDF.*"
@@ -1112,70 +1909,85 @@ async def scheduled_search(context: ContextTypes.DEFAULT_TYPE) -> None:
         "✅ *PDF baixado!*\n\n🔍 Pesquisando palavras-chave..."
     )
     
-    # Faz pesquisa
-    search_results = diario_bot.search_keywords_in_pdf(pdf_bytes, DEFAULT_KEYWORDS)
-    
-    if not search_results["success"]:
+    doc = await run_pdf_task(diario_bot.open_pdf, pdf_path)
+    if not doc:
         await send_notification(
             bot,
-            f"❌ *Erro na pesquisa:* {search_results['error']}"
+            "❌ *Erro ao abrir o PDF.*"
         )
         return
     
-    # Monta mensagem com resultados
-    results = search_results["results"]
-    found_keywords = []
-    message_parts = ["📊 *Resultado da pesquisa das 12:00:*\n"]
-    message_parts.append(f"📰 Edição {info['edition_number']} ({info['edition_date']})\n")
-    
-    for keyword, data in results.items():
-        count = data["count"]
-        pages = data["pages"]
-        
-        if count > 0:
-            found_keywords.append(keyword)
-            pages_str = ", ".join(map(str, pages[:10]))
-            if len(pages) > 10:
-                pages_str += f"... (+{len(pages) - 10})"
-            message_parts.append(f"\n✅ *{keyword}*")
-            message_parts.append(f"   📍 {count} ocorrência(s) em {len(pages)} página(s)")
-            message_parts.append(f"   📄 Páginas: {pages_str}")
-        else:
-            message_parts.append(f"\n❌ *{keyword}* - não encontrado")
-    
-    await send_notification(bot, "\n".join(message_parts))
-    
-    # Se encontrou palavras, gera PDF destacado
-    if found_keywords:
-        await send_notification(
-            bot,
-            f"\n✨ Gerando PDF com {len(found_keywords)} termo(s) destacado(s)..."
+    try:
+        # Faz pesquisa
+        search_results = await run_pdf_task(
+            diario_bot.search_edition, info["edition_number"], doc, DEFAULT_KEYWORDS
         )
         
-        highlighted_pdf = diario_bot.highlight_keywords_in_pdf(
-            pdf_bytes,
-            DEFAULT_KEYWORDS,
-            results
-        )
+        if not search_results["success"]:
+            await send_notification(
+                bot,
+                f"❌ *Erro na pesquisa:* {search_results['error']}"
+            )
+            return
         
-        if highlighted_pdf:
-            pages_found = set()
-            for kw, data in results.items():
-                pages_found.update(data.get("pages", []))
+        # Monta mensagem com resultados
+        results = search_results["results"]
+        found_keywords = []
+        message_parts = ["📊 *Resultado da pesquisa das 12:00:*\n"]
+        message_parts.append(f"📰 Edição {info['edition_number']} ({info['edition_date']})\n")
+        
+        for keyword, data in results.items():
+            count = data["count"]
+            pages = data["pages"]
             
-            await send_document_notification(
+            if count > 0:
+                found_keywords.append(keyword)
+                pages_str = ", ".join(map(str, pages[:10]))
+                if len(pages) > 10:
+                    pages_str += f"... (+{len(pages) - 10})"
+                message_parts.append(f"\n✅ *{keyword}*")
+                message_parts.append(f"   📍 {count} ocorrência(s) em {len(pages)} página(s)")
+                message_parts.append(f"   📄 Páginas: {pages_str}")
+            else:
+                message_parts.append(f"\n❌ *{keyword}* - não encontrado")
+        
+        await send_notification(bot, "\n".join(message_parts))
+        diario_bot.last_notified_edition = info["edition_number"]
+        
+        # Se encontrou palavras, gera PDF destacado
+        if found_keywords:
+            await send_notification(
                 bot,
-                highlighted_pdf,
-                f"DM_{info['edition_number']}_DESTACADO.pdf",
-                f"📰 Edição {info['edition_number']}\n"
-                f"📄 {len(pages_found)} página(s) com palavras encontradas\n"
-                f"🔍 Termos: {', '.join(found_keywords)}"
+                f"\n✨ Gerando PDF com {len(found_keywords)} termo(s) destacado(s)..."
             )
-    else:
-        await send_notification(
-            bot,
-            "\n📭 Nenhuma das palavras-chave foi encontrada nesta edição."
-        )
+            
+            highlighted_pdf = await run_pdf_task(
+                diario_bot.highlight_keywords_in_pdf,
+                doc,
+                DEFAULT_KEYWORDS,
+                results
+            )
+            
+            if highlighted_pdf:
+                pages_found = set()
+                for kw, data in results.items():
+                    pages_found.update(data.get("pages", []))
+                
+                await send_document_notification(
+                    bot,
+                    highlighted_pdf,
+                    f"DM_{info['edition_number']}_DESTACADO.pdf",
+                    f"📰 Edição {info['edition_number']}\n"
+                    f"📄 {len(pages_found)} página(s) com palavras encontradas\n"
+                    f"🔍 Termos: {', '.join(found_keywords)}"
+                )
+        else:
+            await send_notification(
+                bot,
+                "\n📭 Nenhuma das palavras-chave foi encontrada nesta edição."
+            )
+    finally:
+        await run_pdf_task(doc.close)
     
     await send_notification(
         bot,
@@ -1186,6 +1998,18 @@ async def scheduled_search(context: ContextTypes.DEFAULT_TYPE) -> None:
     logger.info("Pesquisa agendada concluída!")
 
 
+async def flush_subscribers_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Salva periodicamente as alterações de inscritos e palavras-chave."""
+    diario_bot.flush_subscribers()
+
+
+async def shutdown_routine(application: Application) -> None:
+    """Rotina executada ao encerrar o bot: salva alterações pendentes e encerra os processos."""
+    diario_bot.flush_subscribers()
+    diario_bot.shutdown_process_pool()
+    PDF_POOL.shutdown(wait=False, cancel_futures=True)
+
+
 def main() -> None:
     """Função principal que inicia o bot."""
     if not BOT_TOKEN:
@@ -1197,8 +2021,12 @@ def main() -> None:
         print("3. Copie o token gerado")
         return
     
-    # Cria a aplicação
-    application = Application.builder().token(BOT_TOKEN).build()
+    # Usa o uvloop quando instalado (Linux/macOS)
+    if uvloop is not None:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    
+    # Cria a aplicação (atualizações processadas em paralelo: um /pesquisar longo não trava os outros usuários)
+    application = Application.builder().token(BOT_TOKEN).concurrent_updates(True).build()
     
     # Adiciona handlers
     application.add_handler(CommandHandler("start", start))
@@ -1224,15 +2052,35 @@ def main() -> None:
     )
     logger.info("⏰ Pesquisa diária agendada para 12:00")
     
+    # Salva inscritos e palavras-chave alterados a cada poucos segundos
+    job_queue.run_repeating(
+        flush_subscribers_job,
+        interval=SUBSCRIBERS_FLUSH_INTERVAL,
+        name="salvar_inscritos"
+    )
+    
     # Adiciona rotina de inicialização
     application.post_init = startup_routine
+    application.post_shutdown = shutdown_routine
     
     # Inicia o bot
     print("🤖 Bot iniciado! Pressione Ctrl+C para parar.")
     print(f"📋 Palavras-chave padrão: {', '.join(DEFAULT_KEYWORDS)}")
     print(f"👥 Usuários inscritos: {len(diario_bot.subscribers)}")
     print("⏰ Pesquisa automática agendada para: 12:00")
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    if WEBHOOK_URL:
+        # Servidor local na porta WEBHOOK_PORT, no mesmo caminho da URL pública (atrás do proxy HTTPS)
+        print(f"🌐 Recebendo mensagens via webhook: {WEBHOOK_URL}")
+        application.run_webhook(
+            listen="0.0.0.0",
+            port=WEBHOOK_PORT,
+            url_path=urlparse(WEBHOOK_URL).path.lstrip("/"),
+            webhook_url=WEBHOOK_URL,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=Update.ALL_TYPES
+        )
+    else:
+        application.run_polling(allowed_updates=Update.ALL_TYPES)
 
 
 if __name__ == "__main__":